@@ -0,0 +1,91 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Optional compiled parser of DeriNet tsv chunks used by derinet_api.
+
+It does the same as derinet_api.parse_nodes_chunk, but walks
+the text character by character with typed indices instead of
+splitting every line into a list of fields and calling int() on them.
+
+Build it in place next to derinet_api.py with
+
+    cythonize -i _derinet_io.pyx
+
+derinet_api falls back to its pure Python parser if it is not built.
+"""
+
+from array import array
+
+
+cdef inline object parse_id(unicode text, Py_ssize_t start, Py_ssize_t stop):
+    """Parse an id from text[start:stop] the same way int() does."""
+    cdef Py_ssize_t value = 0, i
+    cdef Py_UCS4 ch
+    if not 0 < stop - start <= 9:
+        # let int() handle empty and possibly overflowing values
+        return int(text[start:stop])
+    for i in range(start, stop):
+        ch = text[i]
+        if not u'0' <= ch <= u'9':
+            # let int() handle signs, spaces and malformed values
+            return int(text[start:stop])
+        value = value * 10 + (<Py_ssize_t>ch - 48)  # 48 == ord('0')
+    return value
+
+
+def parse_tsv_chunk(unicode text):
+    """
+    Parse nodes from text consisting of whole lines of a DeriNet file.
+
+    Return a tuple with the fields of derinet_api.NodesChunk.
+    """
+    cdef Py_ssize_t n = len(text), line_start = 0, line_stop, i, field
+    cdef Py_ssize_t starts[5]
+    cdef Py_ssize_t stops[5]
+    lex_id = -1
+    cdef Py_UCS4 ch
+    lemmas, morphs, poses, parent_ids = [], [], array('B'), array('i')
+    pos_names, pos_codes, index = [], {}, {}
+
+    while line_start < n:
+        line_stop = text.find(u'\n', line_start)
+        if line_stop < 0:
+            line_stop = n
+        if line_stop == line_start:
+            line_start = line_stop + 1
+            continue
+        # find boundaries of the five tab-separated fields
+        field = 0
+        starts[0] = line_start
+        for i in range(line_start, line_stop):
+            ch = text[i]
+            if ch == u'\t':
+                if field == 4:
+                    raise ValueError('too many values to unpack (expected 5)')
+                stops[field] = i
+                field += 1
+                starts[field] = i + 1
+        if field != 4:
+            raise ValueError('not enough values to unpack '
+                             '(expected 5, got {})'.format(field + 1))
+        stops[4] = line_stop
+
+        lex_id = parse_id(text, starts[0], stops[0])
+        lemma = text[starts[1]:stops[1]]
+        lemmas.append(lemma)
+        morphs.append(text[starts[2]:stops[2]])
+        pos = text[starts[3]:stops[3]]
+        pos_code = pos_codes.get(pos)
+        if pos_code is None:
+            pos_code = pos_codes[pos] = len(pos_names)
+            pos_names.append(pos)
+        poses.append(pos_code)
+        parent_ids.append(parse_id(text, starts[4], stops[4])
+                          if stops[4] > starts[4] else -1)
+        lex_ids = index.get(lemma)
+        if lex_ids is None:
+            index[lemma] = [lex_id]
+        else:
+            lex_ids.append(lex_id)
+        line_start = line_stop + 1
+
+    return lemmas, morphs, poses, pos_names, parent_ids, index, lex_id
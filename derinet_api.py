@@ -1,11 +1,23 @@
 #! /usr/bin/env python3
 
+import gc
 import os
 import sys
+import mmap
 import locale
 from time import time
-from itertools import chain
-from collections import namedtuple
+from array import array
+from bisect import insort
+from itertools import accumulate
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# optional compiled parser of DeriNet files, see _derinet_io.pyx
+try:
+    from _derinet_io import parse_tsv_chunk
+except ImportError:
+    parse_tsv_chunk = None
 
 
 # set Czech locale for correct sorting of entries
@@ -19,6 +31,13 @@ except locale.Error:
           'in your terminal.', file=sys.stderr)
 
 
+# number of bytes decoded at once when loading
+LOAD_CHUNK_SIZE = 1 << 22
+
+# number of nodes formatted at once when saving
+SAVE_BLOCK_SIZE = 65536
+
+
 # user-defined error classes
 class LexemeNotFoundError(Exception):
     pass
@@ -62,15 +81,127 @@ def partial_lexeme_match(node, lemma, pos, morph):
                     ))
 
 # a simple structure to represent a node
+# nodes are built on demand from the columns stored in DeriNet,
+# so they are read-only snapshots: DeriNet itself is changed only
+# through its methods, which update the columns in place
 Node = namedtuple('Node', 
                   ['lex_id',
                    'lemma',
                    'morph',
                    'pos',
-                   'parent_id',
-                   'children', # these are actual children nodes, not ids
+                   'parent_id', # -1 for nodes without a parent
+                   'children', # ids of children nodes
                    ])
 
+def lexeme_fields(lexeme):
+    """Return tsv fields of the node, with an empty parent_id for roots."""
+    return (str(lexeme.lex_id), lexeme.lemma, lexeme.morph, lexeme.pos,
+            '' if lexeme.parent_id < 0 else str(lexeme.parent_id))
+
+def build_children_arrays(parent_ids):
+    """
+    Build children of all nodes given their parent ids.
+
+    Return a pair (flat, offsets) of int arrays, where children ids
+    of node i are flat[offsets[i]:offsets[i + 1]], in ascending order.
+    """
+    # count children of each node and turn the counts into offsets
+    counts = [0] * len(parent_ids)
+    for parent_id in parent_ids:
+        if parent_id >= 0:
+            counts[parent_id] += 1
+    offsets = array('i', accumulate(counts, initial=0))
+    # fill children ids in, each parent has its own write position
+    flat = array('i', [0]) * offsets[-1]
+    fill = offsets.tolist()
+    for lex_id, parent_id in enumerate(parent_ids):
+        if parent_id >= 0:
+            flat[fill[parent_id]] = lex_id
+            fill[parent_id] += 1
+    return flat, offsets
+
+def read_text_chunks(fname, chunk_size=LOAD_CHUNK_SIZE):
+    """
+    Yield contents of utf-8 encoded fname file in chunks of whole lines,
+    each at least chunk_size bytes long except for the last one.
+
+    The file is memory-mapped and every chunk is decoded straight
+    from the mapping, so the file is never held in memory as a whole.
+    """
+    with open(fname, 'rb') as ifile:
+        if os.fstat(ifile.fileno()).st_size == 0:
+            # empty files cannot be mapped
+            return
+        with mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ) as mfile, \
+                memoryview(mfile) as view:
+            start, size = 0, len(mfile)
+            while start < size:
+                stop = mfile.find(b'\n', start + chunk_size)
+                stop = size if stop < 0 else stop + 1
+                yield str(view[start:stop], 'utf-8')
+                start = stop
+
+# nodes parsed from one chunk of a DeriNet file,
+# pos holds codes into pos_names of the chunk
+NodesChunk = namedtuple('NodesChunk',
+                        ['lemmas',
+                         'morphs',
+                         'pos',
+                         'pos_names',
+                         'parent_ids',
+                         'index',   # index[lemma] = [lex_id, ...]
+                         'last_id', # lex_id of the last node, -1 if none
+                         ])
+
+def parse_nodes_chunk(text):
+    """Parse nodes from text consisting of whole lines of a DeriNet file."""
+    if parse_tsv_chunk is not None:
+        return NodesChunk._make(parse_tsv_chunk(text))
+    lemmas, morphs, poses, parent_ids = [], [], array('B'), array('i')
+    pos_names, pos_codes, index = [], {}, {}
+    lex_id = -1
+    # split a whole chunk into lines in C instead of
+    # stepping through the file object line by line
+    for line in text.split('\n'):
+        if not line:
+            continue
+        lex_id, lemma, morph, pos, parent_id = line.split('\t')
+        lex_id = int(lex_id)
+        lemmas.append(lemma)
+        morphs.append(morph)
+        # there are only a handful of distinct pos tags,
+        # so nodes store a small code of the tag instead
+        pos_code = pos_codes.get(pos)
+        if pos_code is None:
+            pos_code = pos_codes[pos] = len(pos_names)
+            pos_names.append(pos)
+        poses.append(pos_code)
+        parent_ids.append(int(parent_id) if parent_id else -1)
+        index.setdefault(lemma, []).append(lex_id)
+    return NodesChunk(lemmas, morphs, poses, pos_names, parent_ids, index, lex_id)
+
+def parse_file_chunks(fname):
+    """
+    Yield NodesChunk for every chunk of fname file, in order.
+
+    Without the GIL (free-threaded Python builds), chunks are parsed
+    in parallel, a few of them ahead of the one being yielded.
+    With the GIL, threads would only take turns on the same core,
+    so chunks are parsed one by one.
+    """
+    workers = os.cpu_count() or 1
+    if getattr(sys, '_is_gil_enabled', lambda: True)() or workers == 1:
+        yield from map(parse_nodes_chunk, read_text_chunks(fname))
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for text in read_text_chunks(fname):
+            pending.append(executor.submit(parse_nodes_chunk, text))
+            if len(pending) > workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
 def lexeme_info(lexeme):
     assert type(lexeme) == Node
     return (lexeme.lemma, lexeme.pos, lexeme.morph)
@@ -78,40 +209,141 @@ def lexeme_info(lexeme):
 
 class DeriNet(object):
 
-    __slots__ = ['_data',  # list of nodes
-                 '_index', # _index[lemma][pos][morph] = lex_id
-                 '_fname', # name of file from which DeriNet was loaded
+    # nodes are stored column-wise: the i-th item of each column
+    # describes the node with lex_id i
+    __slots__ = ['_lemmas',     # lemma of each node
+                 '_morphs',     # morphological string of each node
+                 '_pos',        # array of part of speech codes of each node
+                 '_pos_names',  # part of speech of each code
+                 '_pos_codes',  # code of each part of speech
+                 '_parent_ids', # array of parent ids, -1 for roots
+                 '_children_flat',    # children ids of all nodes, grouped by parent
+                 '_children_offsets', # children of node i are
+                                      # _children_flat[offsets[i]:offsets[i + 1]]
+                 '_children_patch',   # children ids of nodes changed by edits
+                                      # since the arrays were built
+                 '_sort_keys',  # cached lex_sort keys, None if not computed
+                 '_index',      # _index[lemma] = [lex_id, ...]
+                 '_fname',      # name of file from which DeriNet was loaded
                 ]
 
     def __init__(self, fname=None):
         if fname is None:
-            self._data = []
+            self._lemmas = []
+            self._morphs = []
+            self._pos = array('B')
+            self._pos_names = []
+            self._pos_codes = {}
+            self._parent_ids = array('i')
+            self._children_flat = array('i')
+            self._children_offsets = array('i', [0])
+            self._children_patch = {}
+            self._sort_keys = None
             self._index = {}
             self._fname = None
         else:
             self.load(fname)
 
     def _read_nodes_from_file(self, fname):
-        data, index = [], {}
-        with open(fname, 'r', encoding='utf-8') as ifile:
-            for i, line in enumerate(ifile):
-                line = line.strip('\n')
-                lex_id, lemma, morph, pos, parent_id = line.split('\t')
-                data.append(Node(int(lex_id), lemma, morph, pos, 
-                                 parent_id=''
-                                     if parent_id == ''
-                                     else int(parent_id),
-                                 children=[]))
-                index.setdefault(lemma, {})
-                index[lemma].setdefault(pos, {})
-                index[lemma][pos][morph] = int(lex_id)
-        return data, index
+        """
+        Read node columns and index from fname file.
+
+        Return the lex_id of the last node in the file.
+        """
+        lemmas, morphs, poses, parent_ids = [], [], array('B'), array('i')
+        pos_names, pos_codes, index = [], {}, {}
+        lex_id = -1
+        # the parsing allocates millions of objects that are never garbage,
+        # so automatic collections would only rescan them over and over
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for chunk in parse_file_chunks(fname):
+                lemmas.extend(chunk.lemmas)
+                morphs.extend(chunk.morphs)
+                # translate pos codes of the chunk to codes of the whole net
+                code_table = bytearray(range(256))
+                for chunk_code, pos in enumerate(chunk.pos_names):
+                    pos_code = pos_codes.get(pos)
+                    if pos_code is None:
+                        pos_code = pos_codes[pos] = len(pos_names)
+                        pos_names.append(pos)
+                    code_table[chunk_code] = pos_code
+                poses.frombytes(chunk.pos.tobytes().translate(code_table))
+                parent_ids.extend(chunk.parent_ids)
+                # only lemmas seen in earlier chunks need their ids merged
+                for lemma in chunk.index.keys() & index.keys():
+                    index[lemma].extend(chunk.index.pop(lemma))
+                index.update(chunk.index)
+                if chunk.last_id >= 0:
+                    # chunks of blank lines only have no last node
+                    lex_id = chunk.last_id
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self._lemmas, self._morphs, self._pos = lemmas, morphs, poses
+        self._pos_names, self._pos_codes = pos_names, pos_codes
+        self._parent_ids, self._index = parent_ids, index
+        self._sort_keys = None
+        return lex_id
 
     def _populate_children(self):
-        """Populate children for all nodes."""
-        for node in self._data:
-            if node.parent_id != '':
-                self._data[node.parent_id].children.append(node)
+        """Populate children for all nodes from their parent ids."""
+        self._children_flat, self._children_offsets = build_children_arrays(
+                                                          self._parent_ids)
+        self._children_patch = {}
+
+    def _get_children_ids(self, lex_id):
+        """Get list of children ids of the node with lex_id id."""
+        patched = self._children_patch.get(lex_id)
+        if patched is not None:
+            return list(patched)
+        offsets = self._children_offsets
+        if lex_id + 1 >= len(offsets):
+            # node added after the arrays were built
+            return []
+        return self._children_flat[offsets[lex_id]:offsets[lex_id + 1]].tolist()
+
+    def _get_patched_children(self, lex_id):
+        """
+        Get modifiable list of children ids of the node with lex_id id.
+
+        Edits change children through this list instead of rebuilding
+        the arrays, which is left to the next lex_sort.
+        """
+        patched = self._children_patch.get(lex_id)
+        if patched is None:
+            patched = self._children_patch[lex_id] = self._get_children_ids(lex_id)
+        return patched
+
+    def _add_child(self, parent_id, child_id):
+        """Add child_id to children of the node with parent_id id."""
+        insort(self._get_patched_children(parent_id), child_id)
+
+    def _remove_child(self, parent_id, child_id):
+        """Remove child_id from children of the node with parent_id id."""
+        self._get_patched_children(parent_id).remove(child_id)
+
+    def _check_id(self, lex_id):
+        """Raise LexemeNotFoundError if there is no node with lex_id id."""
+        if not 0 <= lex_id < len(self._lemmas):
+            raise LexemeNotFoundError('lexeme with id {} not found'.format(lex_id))
+
+    def _check_parent_id(self, parent_id, child_id):
+        """Raise ParentNotFoundError if there is no node with parent_id id."""
+        if not 0 <= parent_id < len(self._lemmas):
+            raise ParentNotFoundError('invalid parent id {} for node {}: '
+                                      "parent doesn't exist".format(parent_id, child_id))
+
+    def _get_node(self, lex_id):
+        """Build a Node for the node with lex_id id."""
+        self._check_id(lex_id)
+        return Node(lex_id,
+                    self._lemmas[lex_id],
+                    self._morphs[lex_id],
+                    self._pos_names[self._pos[lex_id]],
+                    self._parent_ids[lex_id],
+                    self._get_children_ids(lex_id))
 
     def load(self, fname):
         """Load DeriNet from tsv file."""
@@ -121,12 +353,12 @@ class DeriNet(object):
         print('Loading DeriNet from "{}" file...'.format(fname), file=sys.stderr)
         btime = time()
 
-        self._data, self._index = self._read_nodes_from_file(fname)
+        last_id = self._read_nodes_from_file(fname)
 
-        if len(self._data) - 1 != self._data[-1].lex_id:
+        if len(self._lemmas) - 1 != last_id:
             print('Warning: lexeme numeration in DeriNet file looks inconsistent:\n'
                   'Discovered {} lexemes total but the last was indexed {}'
-                  ''.format(len(self._data), i), file=sys.stderr)
+                  ''.format(len(self._lemmas), last_id), file=sys.stderr)
 
         self._populate_children()
 
@@ -139,19 +371,29 @@ class DeriNet(object):
         print('Sorting DeriNet...', file=sys.stderr)
         btime = time()
         # sort
-        self._data.sort(key=lambda x: locale.strxfrm(x.morph.lower()))
+        # compute every sort key once and let sorted() look them up
+        # through a C-level getter instead of a Python lambda;
+        # the keys are kept in node order for subsequent sorts
+        if self._sort_keys is None:
+            self._sort_keys = list(map(locale.strxfrm,
+                                       map(str.lower, self._morphs)))
+        sort_keys = self._sort_keys
+        order = sorted(range(len(sort_keys)), key=sort_keys.__getitem__)
 
         # reindex
-        reverse_id = [0] * len(self._data) # used for parent_ids only
-        for i, node in enumerate(self._data):
-            reverse_id[node.lex_id] = i
-        for i, node in enumerate(self._data):
-            self._data[i] = node._replace(lex_id=i,
-                                          parent_id=''
-                                              if node.parent_id == ''
-                                              else reverse_id[node.parent_id],
-                                          children=[])
-            self._index[node.lemma][node.pos][node.morph] = i
+        # the trailing -1 maps parent_id -1 of roots back to -1
+        reverse_id = [0] * (len(order) + 1)
+        reverse_id[-1] = -1
+        for i, lex_id in enumerate(order):
+            reverse_id[lex_id] = i
+        self._sort_keys = list(map(sort_keys.__getitem__, order))
+        self._lemmas = list(map(self._lemmas.__getitem__, order))
+        self._morphs = list(map(self._morphs.__getitem__, order))
+        self._pos = array('B', map(self._pos.__getitem__, order))
+        self._parent_ids = array('i', map(reverse_id.__getitem__,
+                                          map(self._parent_ids.__getitem__, order)))
+        for lex_ids in self._index.values():
+            lex_ids[:] = sorted(map(reverse_id.__getitem__, lex_ids))
 
         # repopulate children
         self._populate_children()
@@ -173,67 +415,68 @@ class DeriNet(object):
             self.lex_sort()
         print('Saving snapshot to "{}"'.format(fname), file=sys.stderr)
         btime = time()
-        with open(fname, 'w', encoding='utf-8') as ofile:
-            for lexeme in self._data:
-                print(*lexeme[:-1], sep='\t', file=ofile)
+        lemmas, morphs, pos_names = self._lemmas, self._morphs, self._pos_names
+        with open(fname, 'w', encoding='utf-8', buffering=1 << 20) as ofile:
+            # format nodes in blocks and write each block with one call
+            for start in range(0, len(lemmas), SAVE_BLOCK_SIZE):
+                stop = start + SAVE_BLOCK_SIZE
+                ofile.write(''.join(
+                    '{}\t{}\t{}\t{}\t{}\n'.format(lex_id, lemma, morph,
+                                                 pos_names[pos_code],
+                                                 '' if parent_id < 0 else parent_id)
+                    for lex_id, lemma, morph, pos_code, parent_id in zip(
+                        range(start, stop),
+                        lemmas[start:stop],
+                        morphs[start:stop],
+                        self._pos[start:stop],
+                        self._parent_ids[start:stop])))
         print('Saved in {:.2f} s.'.format(time() - btime), file=sys.stderr)
 
     def get_lexeme_by_id(self, lex_id):
         """Get node with lex_id id."""
-        try:
-            return self._data[lex_id]
-        except IndexError:
-            raise LexemeNotFoundError('lexeme with id {} not found'.format(lex_id))
+        return self._get_node(lex_id)
 
     def show_lexeme_by_id(self, lex_id):
         """Get represantation of node with lex_id id."""
-        try:
-            return lexeme_info(self._data[lex_id])
-        except IndexError:
-            raise LexemeNotFoundError('lexeme with id {} not found'.format(lex_id))
+        return lexeme_info(self._get_node(lex_id))
 
     def search_lexemes(self, lemma, pos=None, morph=None, allow_fallback=False):
         """
         Search for all lexemes that satisfy given lemma, pos and morph,
         and return their representations.
         """
-        lexeme_ids = self.get_ids(lemma, pos=pos, morph=morph)
-        if len(lexeme_ids) == 0 and allow_fallback and morph is not None:
-            lexeme_ids = self.get_ids(lemma, pos=pos, morph=None)
-        return [lexeme_info(self._data[lexeme_id])
+        lexeme_ids = self._find_ids(lemma, pos, morph)
+        if not lexeme_ids and allow_fallback and morph is not None:
+            lexeme_ids = self._find_ids(lemma, pos, None)
+        return [lexeme_info(self._get_node(lexeme_id))
                     for lexeme_id in lexeme_ids]
 
+    def _find_ids(self, lemma, pos, morph):
+        """
+        Find node ids given lemma and optionally
+        pos and morphological string.
+
+        The result may be the index list itself and must not be modified.
+        """
+        lex_ids = self._index.get(lemma)
+        if lex_ids is None:
+            return ()
+        if pos is None and morph is None:
+            return lex_ids
+        if pos is not None:
+            pos_code = self._pos_codes.get(pos)
+            if pos_code is None:
+                return ()
+        return [lex_id for lex_id in lex_ids
+                    if (pos is None or self._pos[lex_id] == pos_code)
+                    and (morph is None or self._morphs[lex_id] == morph)]
+
     def get_ids(self, lemma, pos=None, morph=None):
         """
         Get a list of node ids given lemma and optionally 
         pos and morphological string.
         """
-        if lemma not in self._index:
-            return []
-        lemma_index = self._index[lemma]
-        if pos is None:
-            if morph is None:
-                return list(chain.from_iterable(list(morph_index.values())
-                                for morph_index 
-                                    in lemma_index.values()))
-            else:
-                all_pos_index = dict(list(chain.from_iterable(list(morph_index.items())
-                                        for morph_index 
-                                            in lemma_index.values())))
-                if morph in all_pos_index:
-                    return [all_pos_index[morph]]
-                return []
-        else:
-            if pos not in lemma_index:
-                return []
-            lemma_pos_index = lemma_index[pos]
-            if morph is None:
-                return list(lemma_pos_index.values())
-            else:
-                if morph in lemma_pos_index:
-                    return [lemma_pos_index[morph]]
-                return []
-        return []
+        return list(self._find_ids(lemma, pos, morph))
 
     def get_id(self, lemma, pos=None, morph=None):
         """
@@ -243,8 +486,9 @@ class DeriNet(object):
         Raise exception if no lexeme was found
         or lexeme was ambiguous.
         """
-        id_list = self.get_ids(lemma, pos, morph)
-        if id_list == []:
+        # no need for a copy of the ids, so skip get_ids
+        id_list = self._find_ids(lemma, pos, morph)
+        if not id_list:
             # no such lexeme in the net
             raise LexemeNotFoundError(
                     'lexeme not found: {}'.format(
@@ -259,13 +503,9 @@ class DeriNet(object):
 
     def get_parent_by_id(self, lex_id):
         """Get parent node of the node with lex_id id."""
-        try:
-            parent_id = self._data[lex_id].parent_id
-        except IndexError:
-            raise LexemeNotFoundError('lexeme with id {} not found'.format(lex_id))
-        if parent_id == '':
-            return None
-        return self._data[parent_id]
+        self._check_id(lex_id)
+        parent_id = self._parent_ids[lex_id]
+        return None if parent_id < 0 else self._get_node(parent_id)
 
     def get_parent_by_lexeme(self, lemma, pos=None, morph=None):
         """
@@ -277,16 +517,14 @@ class DeriNet(object):
 
     def get_root_by_id(self, lex_id):
         """Get root node of the node with lex_id id."""
-        try:
-            parent_id = self._data[lex_id].parent_id
-        except IndexError:
-            raise LexemeNotFoundError('lexeme with id {} not found'.format(lex_id))
-        if parent_id == '':
+        self._check_id(lex_id)
+        parent_id = self._parent_ids[lex_id]
+        if parent_id < 0:
             return None
-        current = self._data[parent_id]
-        while current.parent_id != '':
-            current = self._data[current.parent_id]
-        return current
+        parent_ids = self._parent_ids
+        while parent_ids[parent_id] >= 0:
+            parent_id = parent_ids[parent_id]
+        return self._get_node(parent_id)
 
     def get_root_by_lexeme(self, lemma, pos=None, morph=None):
         """
@@ -296,55 +534,74 @@ class DeriNet(object):
         lex_id = self.get_id(lemma, pos=pos, morph=morph)
         return self.get_root_by_id(lex_id)
 
+    def get_ancestors_by_id(self, lex_id):
+        """
+        Get list of ancestors of the node with lex_id id,
+        from its parent up to its root.
+        """
+        self._check_id(lex_id)
+        parent_id = self._parent_ids[lex_id]
+        parent_ids = self._parent_ids
+        ancestors = []
+        while parent_id >= 0:
+            ancestors.append(self._get_node(parent_id))
+            parent_id = parent_ids[parent_id]
+        return ancestors
+
+    def get_ancestors_by_lexeme(self, lemma, pos=None, morph=None):
+        """
+        Get list of ancestors of the node given its lemma
+        and optionally pos and morphological string,
+        from its parent up to its root.
+        """
+        lex_id = self.get_id(lemma, pos=pos, morph=morph)
+        return self.get_ancestors_by_id(lex_id)
+
     def get_children_by_id(self, lex_id):
         """Get list of children of the node with lex_id id."""
-        try:
-            return self._data[lex_id].children
-        except IndexError:
-            raise LexemeNotFoundError('lexeme with id {} not found'.format(lex_id))
+        return [self._get_node(child_id)
+                    for child_id in self._get_node(lex_id).children]
 
     def get_subtree_by_id(self, lex_id):
         """
-        Recursively build a list representing the tree
+        Build a list representing the tree
         with the node with lex_id id as its root.
         """
-        try:
-            lexeme = self._data[lex_id]
-        except IndexError:
-            raise LexemeNotFoundError('lexeme with id {} not found'.format(lex_id))
-        return [lexeme, [self.get_subtree_by_id(child.lex_id)
-                            for child in lexeme.children]]
+        lexeme = self._get_node(lex_id)
+        # walk the tree with an explicit stack, so that deep derivation
+        # chains don't run into the recursion limit
+        subtree = [lexeme, []]
+        stack = [subtree]
+        while stack:
+            lexeme, child_subtrees = stack.pop()
+            child_subtrees.extend([self._get_node(child_id), []]
+                                      for child_id in lexeme.children)
+            stack.extend(child_subtrees)
+        return subtree
 
     def subtree_as_str_from_id(self, lex_id, 
                                form1='',
                                form2='  ',
                                form3=''):
         """
-        Recursively build a string visualizing the tree
+        Build a string visualizing the tree
         with the node with id lex_id as its root.
         """
-        try:
-            lexeme = self._data[lex_id]
-        except IndexError:
-            raise LexemeNotFoundError('lexeme with id {} not found'.format(lex_id))
-        subtree_str = form1 + form3
-        subtree_str += '\t'.join(str(item) for item in lexeme[:-1])
-        if lexeme.children != []:
-            # add all but last children's subtrees
-            for child in lexeme.children[:-1]:
-                subtree_str += '\n' + self.subtree_as_str_from_id(
-                                        child.lex_id,
-                                        form1=form1+form2,
-                                        form2='│ ',
-                                        form3='└─')
-            # add last child's subtree
-            # it has slightly different formatting
-            subtree_str += '\n' + self.subtree_as_str_from_id(
-                                    lexeme.children[-1].lex_id,
-                                    form1=form1+form2,
-                                    form2='  ',
-                                    form3='└─')
-        return subtree_str
+        lexeme = self._get_node(lex_id)
+        lines = []
+        stack = [(lexeme, form1, form2, form3)]
+        while stack:
+            lexeme, form1, form2, form3 = stack.pop()
+            lines.append(form1 + form3 + '\t'.join(lexeme_fields(lexeme)))
+            if lexeme.children != []:
+                # push children in reverse so that they are visited in order;
+                # the last child has slightly different formatting
+                stack.append((self._get_node(lexeme.children[-1]),
+                              form1+form2, '  ', '└─'))
+                for child_id in reversed(lexeme.children[:-1]):
+                    stack.append((self._get_node(child_id),
+                                  form1+form2, '│ ', '└─'))
+        return '\n'.join(lines)
 
     def subtree_as_str_from_lexeme(self, lemma, pos=None, morph=None):
         """
@@ -359,7 +616,7 @@ class DeriNet(object):
                                form2='  ',
                                form3=''):
         """
-        Recursively build a string visualizing the tree
+        Build a string visualizing the tree
         containing the node with id lex_id.
         """
         root = self.get_root_by_id(lex_id)
@@ -377,14 +634,24 @@ class DeriNet(object):
         lex_id = self.get_id(lemma, pos=pos, morph=morph)
         return self.subtree_as_str_with_id(lex_id)
 
+    def _get_lemma_index(self, lemma):
+        """Return dictionary lemma_index[pos][morph] = lex_id for lemma."""
+        lemma_index = {}
+        for lex_id in self._index[lemma]:
+            pos = self._pos_names[self._pos[lex_id]]
+            lemma_index.setdefault(pos, {})[self._morphs[lex_id]] = lex_id
+        return lemma_index
+
     def list_ambiguous_lemmas(self):
         """
         Return a dictionary with all ambiguous lemmas.
         """
         ambig_dict = {}
-        for lemma, lemma_index in self._index.items():
-            if len(lemma_index) > 1:
-                ambig_dict[lemma] = lemma_index
+        for lemma, lex_ids in self._index.items():
+            if len(lex_ids) > 1:
+                lemma_index = self._get_lemma_index(lemma)
+                if len(lemma_index) > 1:
+                    ambig_dict[lemma] = lemma_index
         return ambig_dict
 
     def list_ambiguous_lemmas_pos(self):
@@ -392,12 +659,78 @@ class DeriNet(object):
         Return a dictionary with all ambiguous pairs (lemma, pos).
         """
         ambig_dict = {}
-        for lemma, lemma_index in self._index.items():
-            for pos, lemma_pos_index in lemma_index.items():
-                if len(lemma_pos_index) > 1:
-                    ambig_dict[(lemma, pos)] = lemma_pos_index
+        for lemma, lex_ids in self._index.items():
+            if len(lex_ids) > 1:
+                for pos, lemma_pos_index in self._get_lemma_index(lemma).items():
+                    if len(lemma_pos_index) > 1:
+                        ambig_dict[(lemma, pos)] = lemma_pos_index
         return ambig_dict
 
+    def add_lexemes(self, lexeme_list):
+        """
+        Add new nodes to the net and return a list of their ids.
+
+        Each element in lexeme_list must be in the following format:
+
+        (lemma, pos, morph, parent_id)
+
+        parent_id must be the id of an existing node or of a node
+        preceding it in lexeme_list; pass None in its place
+        to add the node without a parent, e.g.:
+
+        [('divadelnický', 'A', 'divadelnický', 2),
+         ('divadelnickost', 'N', 'divadelnickost', None)]
+        """
+        lexeme_list = list(lexeme_list)
+        first_id = len(self._lemmas)
+        # check all parents before changing anything
+        new_parent_ids = array('i')
+        for lex_id, (lemma, pos, morph, parent_id) in enumerate(lexeme_list,
+                                                                first_id):
+            if parent_id is None:
+                parent_id = -1
+            elif not 0 <= parent_id < lex_id:
+                raise ParentNotFoundError('invalid parent id {} for node {}: '
+                                          "parent doesn't exist".format(
+                                          parent_id, pretty_lexeme(lemma, pos, morph)))
+            new_parent_ids.append(parent_id)
+
+        # build the new columns aside, so that a failure
+        # (e.g. an unhashable lemma or more than 256 distinct pos tags)
+        # leaves the net as it was
+        new_pos_names, new_pos_codes = [], {}
+        new_pos, new_index = array('B'), {}
+        for lex_id, (lemma, pos, morph, _) in enumerate(lexeme_list, first_id):
+            pos_code = self._pos_codes.get(pos)
+            if pos_code is None:
+                pos_code = new_pos_codes.get(pos)
+                if pos_code is None:
+                    pos_code = new_pos_codes[pos] = (len(self._pos_names)
+                                                     + len(new_pos_names))
+                    new_pos_names.append(pos)
+            new_pos.append(pos_code)
+            new_index.setdefault(lemma, []).append(lex_id)
+        new_lemmas = [lexeme[0] for lexeme in lexeme_list]
+        new_morphs = [lexeme[2] for lexeme in lexeme_list]
+        new_sort_keys = None
+        if self._sort_keys is not None:
+            new_sort_keys = list(map(locale.strxfrm, map(str.lower, new_morphs)))
+
+        self._lemmas.extend(new_lemmas)
+        self._morphs.extend(new_morphs)
+        self._pos.extend(new_pos)
+        self._pos_names.extend(new_pos_names)
+        self._pos_codes.update(new_pos_codes)
+        self._parent_ids.extend(new_parent_ids)
+        for lemma, lex_ids in new_index.items():
+            self._index.setdefault(lemma, []).extend(lex_ids)
+        if new_sort_keys is not None:
+            self._sort_keys.extend(new_sort_keys)
+        for lex_id, parent_id in enumerate(new_parent_ids, first_id):
+            if parent_id >= 0:
+                self._add_child(parent_id, lex_id)
+        return list(range(first_id, len(self._lemmas)))
+
     def add_edge_by_ids(self, child_id, parent_id, force=False):
         """
         Add an edge from the node with lex_id=parent_id
@@ -406,47 +739,41 @@ class DeriNet(object):
         If force=True, (re)assign parent regardless of the fact
         that the node already has a parent.
         """
-        try:
-            child = self._data[child_id]
-        except IndexError:
-            raise LexemeNotFoundError('lexeme with id {} not found'.format(child_id))
-        try:
-            parent = self._data[parent_id]
-        except IndexError:
-            raise ParentNotFoundError('invalid parent id {} for node {}: '
-                                      "parent doesn't exist".format(parent_id, child_id))
-        if not force and child.parent_id != '' and child.parent_id is not None:
+        self._check_id(child_id)
+        self._check_parent_id(parent_id, child_id)
+        parent_ids = self._parent_ids
+        old_parent_id = parent_ids[child_id]
+        parent_parent_id = parent_ids[parent_id]
+        if not force and old_parent_id >= 0:
             raise AlreadyHasParentError('node {} already has a parent '
                                         'assigned to it: {}'.format(child_id, parent_id))
         else:
-            try:
-                if self._data[child_id].parent_id != '' and force:
-                    # remove the child from old parent children
-                    old_parent = self._data[child.parent_id]
-                    self._data[child.parent_id] = old_parent._replace(children=[new_child for new_child in old_parent.children if new_child != child])
-                if self._data[parent_id].parent_id == child_id and force:
-                    # turned out we have to reverse the edge
-                    self._data[parent_id] = self._data[parent_id]._replace(parent_id=self._data[child_id].parent_id)
-                    child = self._data[child_id]
-                    self._data[child_id] = child._replace(children=[new_child for new_child in child.children if new_child != parent])
-                    if self._data[parent_id].lex_id == self._data[parent_id].parent_id:
-                        self._data[parent_id] = self._data[parent_id]._replace(parent_id='')
-                self._data[child_id] = child._replace(parent_id=parent_id)
-                self._data[parent_id].children.append(self._data[child_id])
-
-                # check for possible cycle creation
-                cycle_count, current, visited = 0, self._data[parent_id], {self._data[child_id].lex_id}
-                while current.parent_id != '' and current.lex_id not in visited:
-                    visited.add(current.lex_id)
-                    current = self._data[current.parent_id]
-                    cycle_count += 1
-
-                if current.parent_id != '' and cycle_count > 0:
-                    raise CycleCreationError('setting node {} as a parent of node {} '
-                                             'would create a cycle'.format(parent_id, child_id))
-            except CycleCreationError:
-                    raise CycleCreationError('setting node {} as a parent of node {} '
-                                             'would create a cycle'.format(parent_id, child_id))
+            if old_parent_id >= 0 and force:
+                # remove the child from old parent children
+                self._remove_child(old_parent_id, child_id)
+            if parent_parent_id == child_id != parent_id and force:
+                # turned out we have to reverse the edge
+                # (a node being its own parent stays so)
+                self._remove_child(child_id, parent_id)
+                if old_parent_id == parent_id:
+                    parent_ids[parent_id] = -1
+                else:
+                    parent_ids[parent_id] = old_parent_id
+                    if old_parent_id >= 0:
+                        self._add_child(old_parent_id, parent_id)
+            parent_ids[child_id] = parent_id
+            self._add_child(parent_id, child_id)
+
+            # check for possible cycle creation
+            cycle_count, current, visited = 0, parent_id, {child_id}
+            while parent_ids[current] >= 0 and current not in visited:
+                visited.add(current)
+                current = parent_ids[current]
+                cycle_count += 1
+
+            if parent_ids[current] >= 0 and cycle_count > 0:
+                raise CycleCreationError('setting node {} as a parent of node {} '
+                                         'would create a cycle'.format(parent_id, child_id))
 
     def add_edge_by_lexemes(self, 
                             child_lemma, parent_lemma, 
@@ -489,7 +816,7 @@ class DeriNet(object):
         try:
             self.add_edge_by_ids(child_id, parent_id, force=force)
         except AlreadyHasParentError:
-            actual_parent = self.get_lexeme_by_id(self._data[child_id].parent_id)
+            actual_parent = self.get_lexeme_by_id(self._parent_ids[child_id])
             if not ignore_if_exists:
                 raise AlreadyHasParentError('node {} already has a parent '
                                             'assigned to it: {}'.format(
@@ -539,24 +866,13 @@ class DeriNet(object):
         Remove an edge from the node with lex_id=parent_id
         to the node with lex_id=child_id checking for consistency.
         """
-        try:
-            child = self._data[child_id]
-        except IndexError:
-            raise LexemeNotFoundError('lexeme with id {} not found'.format(child_id))
-        if child.parent_id != parent_id:
+        self._check_id(child_id)
+        if self._parent_ids[child_id] != parent_id:
             raise IsNotParentError('node {} is not a parent '
                                    'of node {}'.format(parent_id, child_id))
-        try:
-            parent = self._data[parent_id]
-        except IndexError:
-            raise ParentNotFoundError("invalid parent id {} for node {}: "
-                                      "parent doesn't exist".format(parent_id, child_id))
-        new_children = [child 
-                            for child
-                                in self._data[child.parent_id].children
-                                    if child.lex_id != child_id]
-        self._data[child.parent_id] = self._data[child.parent_id]._replace(children=new_children)
-        self._data[child_id] = child._replace(parent_id='')
+        self._check_parent_id(parent_id, child_id)
+        self._remove_child(parent_id, child_id)
+        self._parent_ids[child_id] = -1
 
     def remove_edge_by_lexemes(self, 
                             child_lemma, parent_lemma, 